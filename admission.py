@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import deque
+
+from config import (ANALYSIS_MAX_CONCURRENT, ANALYSIS_MAX_QUEUE, ANALYSIS_MAX_PER_USER, ANALYSIS_MAX_PER_CHAT,
+                    ANALYSIS_DROP_SUPERSEDED)
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; the message is meant for the user"""
+
+
+class RequestSuperseded(Exception):
+    """Raised to a queued request that was replaced by a newer request of the same user"""
+
+
+class Ticket:
+    def __init__(self, user_id: int, chat_id: int, key=None):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.key = key  # Identity of the requested content
+        self.admitted = asyncio.get_running_loop().create_future()
+        self.released = False
+
+
+class AdmissionController:
+    """
+    Bounds the number of analyses that run and wait at the same time.
+
+    At most max_concurrent requests run, the rest wait in a FIFO queue of at
+    most max_queue requests. Each user and each chat may have only a limited
+    number of requests queued or running. When a user sends the same content
+    again (e.g. re-forwards a post) while the earlier request is still queued,
+    the new request replaces it and takes its place. Background work started
+    by the bot itself (channel digests) shares the running slots and the
+    queue but is not subject to the quotas.
+    """
+
+    def __init__(self, max_concurrent: int = ANALYSIS_MAX_CONCURRENT, max_queue: int = ANALYSIS_MAX_QUEUE,
+                 max_per_user: int = ANALYSIS_MAX_PER_USER, max_per_chat: int = ANALYSIS_MAX_PER_CHAT,
+                 drop_superseded: bool = ANALYSIS_DROP_SUPERSEDED):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_per_chat = max_per_chat
+        self.drop_superseded = drop_superseded
+        self.queue = deque()  # Tickets waiting for a slot
+        self.running = set()  # Tickets holding a slot
+
+    def _active(self):
+        yield from self.running
+        yield from self.queue
+
+    def submit(self, user_id: int, chat_id: int, key=None, background: bool = False) -> Ticket:
+        """
+        Queue a request
+
+        Args:
+            user_id (int): User who made the request
+            chat_id (int): Chat where the request was made
+            key: Identity of the requested content; requests without a key are never superseded
+            background (bool): Work the bot started itself; it is never rejected, only queued
+
+        Returns:
+            Ticket: Ticket to wait on and release when done
+
+        Raises:
+            AdmissionRejected: If a quota or the queue limit is exceeded
+        """
+        ticket = Ticket(user_id, chat_id, key)
+
+        if self.drop_superseded and key is not None:
+            for index, queued in enumerate(self.queue):
+                if queued.user_id == user_id and queued.chat_id == chat_id and queued.key == key:
+                    # The newer request takes the place of the older one in the queue
+                    self.queue[index] = ticket
+                    queued.admitted.set_exception(RequestSuperseded())
+                    logger.info(f"Request of user {user_id} in chat {chat_id} superseded by a newer one")
+                    return ticket
+
+        if not background:
+            if sum(1 for active in self._active() if active.user_id == user_id) >= self.max_per_user:
+                raise AdmissionRejected("⏳ У вас вже є запити в черзі. Дочекайтеся їх результатів.")
+            if sum(1 for active in self._active() if active.chat_id == chat_id) >= self.max_per_chat:
+                raise AdmissionRejected("⏳ У цьому чаті вже забагато запитів у черзі. Спробуйте трохи пізніше.")
+
+        if len(self.running) < self.max_concurrent:
+            self.running.add(ticket)
+            ticket.admitted.set_result(True)
+        elif len(self.queue) < self.max_queue or background:
+            self.queue.append(ticket)
+        else:
+            logger.warning(f"Queue is full ({len(self.queue)} requests), rejecting request of user {user_id}")
+            raise AdmissionRejected("⏳ Бот зараз перевантажений. Спробуйте трохи пізніше.")
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """Position of the ticket in the queue (1 is next), or 0 if it is already running"""
+        try:
+            return self.queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    async def wait(self, ticket: Ticket):
+        """
+        Wait until the request may run
+
+        Raises:
+            RequestSuperseded: If a newer request of the same user replaced this one
+        """
+        await asyncio.shield(ticket.admitted)
+
+    def release(self, ticket: Ticket):
+        """Free the ticket's slot (or queue place) and start the next queued request"""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket in self.running:
+            self.running.discard(ticket)
+        elif ticket in self.queue:
+            self.queue.remove(ticket)
+        while self.queue and len(self.running) < self.max_concurrent:
+            next_ticket = self.queue.popleft()
+            self.running.add(next_ticket)
+            next_ticket.admitted.set_result(True)
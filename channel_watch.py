@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import os
+
+from config import CHANNEL_WATCH_WINDOW, CHANNEL_WATCH_MAX_POSTS, CHANNEL_WATCH_CHANNELS, CHANNEL_WATCH_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelWatcher:
+    """
+    Buffers posts of watched channels and hands them over in windows.
+
+    A window starts with the first post after the previous flush and is
+    flushed after `window` seconds or as soon as it holds `max_posts` posts,
+    whichever comes first. Watched channels are the ones from
+    CHANNEL_WATCH_CHANNELS plus those subscribed with /watch, which are kept
+    in CHANNEL_WATCH_FILE across restarts.
+    """
+
+    def __init__(self, flush_callback, window: float = CHANNEL_WATCH_WINDOW, max_posts: int = CHANNEL_WATCH_MAX_POSTS,
+                 watch_file: str = CHANNEL_WATCH_FILE):
+        self.flush_callback = flush_callback  # (chat_id, posts, updates) -> task processing the window
+        self.window = window
+        self.max_posts = max_posts
+        self.watch_file = watch_file
+        self.channels = set(CHANNEL_WATCH_CHANNELS) | self._load()
+        self.buffers = {}  # chat_id -> {'posts': [], 'updates': [], 'timer': task}
+        self.flush_tasks = set()  # Keeps references to running flushes
+
+    def _load(self) -> set:
+        if not os.path.exists(self.watch_file):
+            return set()
+        try:
+            with open(self.watch_file, encoding="utf-8") as f:
+                return set(json.load(f))
+        except Exception as e:
+            logger.error(f"Error loading watched channels: {e}")
+            return set()
+
+    def _save(self):
+        try:
+            with open(self.watch_file, "w", encoding="utf-8") as f:
+                json.dump(sorted(self.channels - set(CHANNEL_WATCH_CHANNELS)), f)
+        except Exception as e:
+            logger.error(f"Error saving watched channels: {e}")
+
+    def is_watched(self, chat_id: int) -> bool:
+        return chat_id in self.channels
+
+    def watch(self, chat_id: int):
+        """Start buffering posts of a channel"""
+        self.channels.add(chat_id)
+        self._save()
+
+    def unwatch(self, chat_id: int):
+        """Stop watching a channel; posts already buffered are still flushed"""
+        self.channels.discard(chat_id)
+        self._save()
+
+    def add(self, update):
+        """Buffer a channel post, flushing the window if it is full"""
+        post = update.channel_post
+        buffer = self.buffers.get(post.chat_id)
+        if buffer is None:
+            buffer = self.buffers[post.chat_id] = {'posts': [], 'updates': [], 'timer': None}
+            buffer['timer'] = asyncio.create_task(self._flush_after_window(post.chat_id))
+        buffer['posts'].append(post)
+        buffer['updates'].append(update)
+
+        if len(buffer['posts']) >= self.max_posts:
+            self._start_flush(post.chat_id)
+
+    async def _flush_after_window(self, chat_id: int):
+        await asyncio.sleep(self.window)
+        self._start_flush(chat_id)
+
+    def _start_flush(self, chat_id: int):
+        buffer = self.buffers.pop(chat_id, None)
+        if not buffer:
+            return
+        if buffer['timer'] and buffer['timer'] is not asyncio.current_task():
+            buffer['timer'].cancel()
+        # The callback creates the task itself, so it can track the flush before the task starts running
+        task = self.flush_callback(chat_id, buffer['posts'], buffer['updates'])
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    def take_buffered_updates(self) -> list:
+        """Stop all windows and return the updates of posts that were not flushed yet"""
+        updates = []
+        for buffer in self.buffers.values():
+            if buffer['timer']:
+                buffer['timer'].cancel()
+            updates.extend(buffer['updates'])
+        self.buffers.clear()
+        return updates
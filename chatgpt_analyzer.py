@@ -1,9 +1,15 @@
-import openai
+import asyncio
+import json
+import logging
+import threading
 
-from config import OPENAI_API_KEY, OPENAI_MODEL
+from config import (OPENAI_API_KEY, OPENAI_MODEL, MICRO_BATCH_ENABLED, MICRO_BATCH_WAIT_MS, MICRO_BATCH_MAX_SIZE,
+                    MICRO_BATCH_MAX_CHARS, MICRO_BATCH_ITEM_MAX_LENGTH, ANALYSIS_MAX_CONCURRENT)
 
-# Configure OpenAI client
-openai.api_key = OPENAI_API_KEY
+logger = logging.getLogger(__name__)
+
+# Only ANALYSIS_MAX_CONCURRENT analyses run at once, so a batch can never collect more posts than that
+MICRO_BATCH_SIZE = min(MICRO_BATCH_MAX_SIZE, ANALYSIS_MAX_CONCURRENT)
 
 IMPORTANT_PROMPT = """
 Answer only in Ukrainian.
@@ -15,6 +21,25 @@ IMPORTANT:
 
 """
 
+# Response format of a single post analysis
+ANALYSIS_FORMAT = """
+📰 Summary: [one short sentence summarizing the post]
+📊 Assessment (0–100%):
+• Propaganda: XX% – [1 sentence explaining the score]
+• Falsehood: XX% – [1 sentence explaining the score]
+• Populism: XX% – [1 sentence explaining the score]
+• Emotional Manipulation: XX% – [1 sentence explaining the score]
+• Toxicity: XX% – [1 sentence explaining the score]
+• War Panic: XX% – [1 sentence explaining the score]
+• Shitposting/Trolling: XX% – [1 sentence explaining the score]
+🔍 Source: [name of source or channel] — [type: official / tabloid / gossip / bot / propaganda / Russian / anonymous / etc.]
+📑 Fact-Check:
+• [claim 1 from the post]: true / false / unverified [with a brief explanation or fact-check source if needed]
+• [claim 2 from the post]: ...
+✅ Conclusion: [1–2 sentences with the overall judgment and advice for the reader on what to do with the information]
+📎 Warning: [if appropriate — add a warning, e.g., "This channel often spreads panic, disinformation, or unverified content."]
+"""
+
 DEFAULT_PROMPT = """
 Your task is to quickly and accurately assess a news or social media post.
 
@@ -32,39 +57,138 @@ Instructions:
 📥 Analyze the following post:
 CHANNEL: {channel_name}
 POST: {post_text}
+LINKS (fetched titles and lead paragraphs of linked pages):
+{links_summary}
 
 📤 Response Format:
+""" + ANALYSIS_FORMAT
 
-📰 Summary: [one short sentence summarizing the post]
-📊 Assessment (0–100%):
-• Propaganda: XX% – [1 sentence explaining the score]
-• Falsehood: XX% – [1 sentence explaining the score]
-• Populism: XX% – [1 sentence explaining the score]
-• Emotional Manipulation: XX% – [1 sentence explaining the score]
-• Toxicity: XX% – [1 sentence explaining the score]
-• War Panic: XX% – [1 sentence explaining the score]
-• Shitposting/Trolling: XX% – [1 sentence explaining the score]
-🔍 Source: [name of source or channel] — [type: official / tabloid / gossip / bot / propaganda / Russian / anonymous / etc.]
-📑 Fact-Check:
-• [claim 1 from the post]: true / false / unverified [with a brief explanation or fact-check source if needed]
-• [claim 2 from the post]: ...
-✅ Conclusion: [1–2 sentences with the overall judgment and advice for the reader on what to do with the information]
-📎 Warning: [if appropriate — add a warning, e.g., "This channel often spreads panic, disinformation, or unverified content."]
+MICRO_BATCH_PROMPT = """
+Your task is to quickly and accurately assess several independent news or social media posts.
+
+{important_prompt}
+
+Instructions:
+- Respond only in Ukrainian.
+- Assess every post on its own; do not mix information between the posts.
+- The format should be short, structured, and mobile-friendly for Telegram.
+- Use emojis to visually separate information blocks.
+- If there is a link or a source mentioned, describe it (official / fake / propaganda / tabloid / expert / blog / etc.).
+- If the source is a repost, try to identify the original.
+- Always respond, even if the post is a meme, joke, or emotional bait.
+- Pay special attention to topics related to war and panic.
+- The analysis of each post must be at most {item_max_length} characters long; this limit replaces the maximum response length above.
+
+📥 Analyze the following posts. Each post starts with a line "=== POST <id> ===".
+
+{posts}
+
+📤 Respond with a JSON object only: {{"items": [{{"id": <post id>, "analysis": "<analysis of the post>"}}]}}
+Every analysis must be in this format:
+""" + ANALYSIS_FORMAT
+
+
+CHANNEL_BATCH_PROMPT = """
+Your task is to assess a batch of posts from one Telegram channel and write a short digest of them.
+
+Instructions:
+- Write the summaries and the digest only in Ukrainian, as plain text without any formatting.
+- Score every post separately; use the other posts only as context.
+- Pay special attention to topics related to war and panic.
+
+📥 Posts from CHANNEL: {channel_name}
+Each post starts with a line "=== POST <id> ===".
+
+{posts}
+
+📤 Respond with a JSON object only, in this format:
+{{
+  "posts": [
+    {{
+      "id": <post id>,
+      "summary": "<one short sentence summarizing the post>",
+      "propaganda": <0-100>,
+      "falsehood": <0-100>,
+      "populism": <0-100>,
+      "emotional_manipulation": <0-100>,
+      "toxicity": <0-100>,
+      "war_panic": <0-100>,
+      "shitposting": <0-100>
+    }}
+  ],
+  "digest": "<3-6 sentences: main topics of the batch, overall reliability of the channel in this period and what the reader should watch out for>"
+}}
 """
 
 
 class ChatGPTAnalyzer:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._client_future = None  # Client creation running in a worker thread
+        # Micro-batching of short text analyses
+        self.batch_pending = []  # {'post_text', 'channel_name', 'links_summary', 'future'}
+        self.batch_timer = None
+        self.batch_tasks = set()  # Keeps references to running batch requests
+
+    @property
+    def client(self):
+        """OpenAI client, created on first use because importing the SDK is slow"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import openai
+                    self._client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+        return self._client
 
-    async def analyze_post(self, post_text: str, channel_name: str = "Unknown", custom_prompt: str = "") -> str:
+    def warm_up(self):
+        """Import the OpenAI SDK and create the client ahead of the first analysis"""
+        return self.client
+
+    async def get_client(self):
+        """OpenAI client; the SDK is imported in a worker thread, so the event loop is never blocked"""
+        if self._client is None:
+            if self._client_future is None:
+                self._client_future = asyncio.get_running_loop().run_in_executor(None, self.warm_up)
+            try:
+                await asyncio.shield(self._client_future)
+            except Exception:
+                # Let the next call try again
+                self._client_future = None
+                raise
+        return self._client
+
+    async def analyze_post(self, post_text: str, channel_name: str = "Unknown", custom_prompt: str = "",
+                           links_summary: str = "") -> str:
         """
         Analyze a post using ChatGPT API
+
+        Short posts without a custom prompt are micro-batched with other
+        short posts into one request when MICRO_BATCH_ENABLED is set.
+
+        Args:
+            post_text (str): The text content of the post to analyze
+            channel_name (str): Name of the channel where the post was shared
+            custom_prompt (str): Custom prompt to use for analysis (optional)
+            links_summary (str): Summary of the pages linked from the post (optional)
+
+        Returns:
+            str: Analysis result from ChatGPT
+        """
+        if MICRO_BATCH_ENABLED and len(custom_prompt.strip()) <= 3 and len(post_text) <= MICRO_BATCH_MAX_CHARS:
+            return await self.analyze_post_batched(post_text, channel_name, links_summary)
+        return await self.analyze_single_post(post_text, channel_name, custom_prompt, links_summary)
+
+    async def analyze_single_post(self, post_text: str, channel_name: str = "Unknown", custom_prompt: str = "",
+                                  links_summary: str = "") -> str:
+        """
+        Analyze a post using ChatGPT API in a request of its own
         
         Args:
             post_text (str): The text content of the post to analyze
             channel_name (str): Name of the channel where the post was shared
             custom_prompt (str): Custom prompt to use for analysis (optional)
+            links_summary (str): Summary of the pages linked from the post (optional)
             
         Returns:
             str: Analysis result from ChatGPT
@@ -81,18 +205,21 @@ class ChatGPTAnalyzer:
 
                 Channel: {channel_name}
                 Message: {post_text}
+                Links: {links_summary or "None"}
                 Question: {custom_prompt}
                 
                 """
                 messages.append({"role": "system", "content": "You are a helpful assistant, you will receive a Message, Channel and a Question about the Message, Answer please on the Question(-s)."})
             else:
                 # Use default prompt
-                prompt = DEFAULT_PROMPT.format(important_prompt=IMPORTANT_PROMPT, post_text=post_text, channel_name=channel_name)
+                prompt = DEFAULT_PROMPT.format(important_prompt=IMPORTANT_PROMPT, post_text=post_text, channel_name=channel_name,
+                                              links_summary=links_summary or "None")
                 messages.append({"role": "system", "content": 'You are a master of information warfare, an expert in detecting propaganda, manipulation, and fake news.'})
             
             messages.append({"role": "user", "content": prompt})
             # Call ChatGPT API
-            response = self.client.chat.completions.create(
+            client = await self.get_client()
+            response = await client.chat.completions.create(
                 model=OPENAI_MODEL,
                 messages=messages,
                 temperature=1
@@ -103,7 +230,8 @@ class ChatGPTAnalyzer:
         except Exception as e:
             return f"Error analyzing post: {str(e)}"
 
-    async def analyze_image_post(self, image_urls: list, post_text: str, caption: str, channel_name: str = "Unknown", custom_prompt: str = "") -> str:
+    async def analyze_image_post(self, image_urls: list, post_text: str, caption: str, channel_name: str = "Unknown", custom_prompt: str = "",
+                                 links_summary: str = "") -> str:
         """
         Analyze an image post using ChatGPT Vision API (supports multiple images)
         
@@ -113,6 +241,7 @@ class ChatGPTAnalyzer:
             caption (str): The caption or description of the images
             channel_name (str): Name of the channel where the post was shared
             custom_prompt (str): Custom prompt to use for analysis (optional)
+            links_summary (str): Summary of the pages linked from the post (optional)
             
         Returns:
             str: Analysis result from ChatGPT
@@ -129,6 +258,7 @@ class ChatGPTAnalyzer:
                 Channel: {channel_name}
                 Post: {post_text}
                 Caption: {caption or "No text provided"}
+                Links: {links_summary or "None"}
                 Question: {custom_prompt}
                 """
                 messages.append({"role": "system", "content": custom_prompt})
@@ -136,7 +266,8 @@ class ChatGPTAnalyzer:
                                  "content": "You are a helpful assistant, you will receive a Message, Channel and a Question about the Message, Answer please on the Question(-s)."})
             else:
                 # Use default prompt
-                prompt = DEFAULT_PROMPT.format(important_prompt=IMPORTANT_PROMPT, channel_name=channel_name, post_text=post_text) + f"""
+                prompt = DEFAULT_PROMPT.format(important_prompt=IMPORTANT_PROMPT, channel_name=channel_name, post_text=post_text,
+                                              links_summary=links_summary or "None") + f"""
                 Caption: {caption or "No text provided"}
                 """
                 messages.append({"role": "system", "content": 'You are a master of information warfare, an expert in detecting propaganda, manipulation, and fake news.'})
@@ -148,7 +279,8 @@ class ChatGPTAnalyzer:
             messages.append({"role": "user", "content": message_content})
 
             # Call ChatGPT Vision API
-            response = self.client.chat.completions.create(
+            client = await self.get_client()
+            response = await client.chat.completions.create(
                 model=OPENAI_MODEL,
                 messages=messages,
                 temperature=1
@@ -159,6 +291,98 @@ class ChatGPTAnalyzer:
         except Exception as e:
             return f"Error analyzing image post: {str(e)}"
 
+    async def analyze_post_batched(self, post_text: str, channel_name: str, links_summary: str = "") -> str:
+        """
+        Queue a short post for the next micro-batch and wait for its analysis
+
+        The batch is sent after MICRO_BATCH_WAIT_MS or as soon as it holds
+        MICRO_BATCH_SIZE posts, whichever comes first.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.batch_pending.append({
+            'post_text': post_text,
+            'channel_name': channel_name,
+            'links_summary': links_summary,
+            'future': future
+        })
+        if len(self.batch_pending) >= MICRO_BATCH_SIZE:
+            self.start_batch()
+        elif self.batch_timer is None:
+            self.batch_timer = asyncio.create_task(self.start_batch_after_delay())
+        return await future
+
+    async def start_batch_after_delay(self):
+        await asyncio.sleep(MICRO_BATCH_WAIT_MS / 1000)
+        self.batch_timer = None
+        self.start_batch()
+
+    def start_batch(self):
+        """Send the pending posts as one batch"""
+        if self.batch_timer and self.batch_timer is not asyncio.current_task():
+            self.batch_timer.cancel()
+        self.batch_timer = None
+        items, self.batch_pending = self.batch_pending, []
+        if not items:
+            return
+        task = asyncio.create_task(self.analyze_batch(items))
+        self.batch_tasks.add(task)
+        task.add_done_callback(self.batch_tasks.discard)
+
+    async def analyze_batch(self, items: list):
+        """Analyze several posts in one request and fan the results out to the waiting callers"""
+        # Callers that gave up (e.g. cancelled on shutdown) are not analyzed
+        items = [item for item in items if not item['future'].done()]
+        if not items:
+            return
+
+        analyses = {}
+        if len(items) > 1:
+            try:
+                posts_text = "\n\n".join(
+                    f"=== POST {index} ===\nCHANNEL: {item['channel_name']}\nPOST: {item['post_text']}\n"
+                    f"LINKS (fetched titles and lead paragraphs of linked pages):\n{item['links_summary'] or 'None'}"
+                    for index, item in enumerate(items, 1)
+                )
+                messages = [
+                    {"role": "system", "content": 'You are a master of information warfare, an expert in detecting propaganda, manipulation, and fake news.'},
+                    {"role": "user", "content": MICRO_BATCH_PROMPT.format(important_prompt=IMPORTANT_PROMPT, posts=posts_text,
+                                                                          item_max_length=MICRO_BATCH_ITEM_MAX_LENGTH)}
+                ]
+                client = await self.get_client()
+                response = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    temperature=1,
+                    response_format={"type": "json_object"}
+                )
+                # A response cut off at the model's output limit is not valid JSON; say why it failed
+                if response.choices[0].finish_reason == "length":
+                    raise ValueError("response was cut off at the token limit")
+                result = json.loads(response.choices[0].message.content)
+                for entry in result.get("items", []):
+                    if isinstance(entry, dict) and isinstance(entry.get("analysis"), str) and entry["analysis"].strip():
+                        analyses[str(entry.get("id"))] = entry["analysis"].strip()
+                logger.info(f"Micro-batch of {len(items)} posts answered {len(analyses)} of them")
+            except Exception as e:
+                logger.warning(f"Micro-batch of {len(items)} posts failed, falling back to single requests: {e}")
+
+        # Posts the batch did not answer are analyzed one by one
+        fallback = []
+        for index, item in enumerate(items, 1):
+            analysis = analyses.get(str(index))
+            if analysis is None:
+                fallback.append(item)
+            elif not item['future'].done():
+                item['future'].set_result(analysis)
+
+        results = await asyncio.gather(*(
+            self.analyze_single_post(item['post_text'], item['channel_name'], links_summary=item['links_summary'])
+            for item in fallback
+        ))
+        for item, analysis in zip(fallback, results):
+            if not item['future'].done():
+                item['future'].set_result(analysis)
+
     async def answer_general_question(self, question: str) -> str:
         """
         Answer a general user question as a helpful assistant in Ukrainian (HTML for Telegram).
@@ -171,7 +395,8 @@ class ChatGPTAnalyzer:
                 },
                 {"role": "user", "content": question}
             ]
-            response = self.client.chat.completions.create(
+            client = await self.get_client()
+            response = await client.chat.completions.create(
                 model=OPENAI_MODEL,
                 messages=messages,
                 temperature=1
@@ -179,3 +404,79 @@ class ChatGPTAnalyzer:
             return response.choices[0].message.content.strip()
         except Exception as e:
             return f"Вибачте, сталася помилка: {str(e)}"
+
+    async def answer_follow_up(self, question: str, conversation: dict) -> str:
+        """
+        Answer a follow-up question about an already analyzed post
+
+        The stored post text and analysis are sent instead of the original
+        images, so no media is uploaded again.
+
+        Args:
+            question (str): The follow-up question
+            conversation (dict): Conversation from ConversationStore
+
+        Returns:
+            str: Answer from ChatGPT
+        """
+        try:
+            images_note = ""
+            if conversation['image_count']:
+                images_note = f"\nImages: {conversation['image_count']} (already analyzed, see your previous analysis)"
+            messages = [
+                {
+                    "role": "system",
+                    "content": f"You are a master of information warfare, an expert in detecting propaganda, manipulation, and fake news. You have already analyzed a post; answer the follow-up questions about it (short and accurate). \n {IMPORTANT_PROMPT}"
+                },
+                {
+                    "role": "user",
+                    "content": f"Channel: {conversation['channel_name']}\nPost: {conversation['post_text'] or 'No text provided'}{images_note}"
+                },
+                {"role": "assistant", "content": conversation['analysis']}
+            ]
+            for previous_question, previous_answer in conversation['turns']:
+                messages.append({"role": "user", "content": previous_question})
+                messages.append({"role": "assistant", "content": previous_answer})
+            messages.append({"role": "user", "content": question})
+
+            client = await self.get_client()
+            response = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=1
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            return f"Вибачте, сталася помилка: {str(e)}"
+
+    async def analyze_channel_batch(self, posts: list, channel_name: str = "Unknown") -> dict:
+        """
+        Score a batch of channel posts and write a digest in a single request
+
+        Args:
+            posts (list): Posts as dicts with "id" and "text"
+            channel_name (str): Name of the channel
+
+        Returns:
+            dict: {"posts": [per-post scores], "digest": str}, or None if the request or parsing failed
+        """
+        try:
+            posts_text = "\n\n".join(f"=== POST {post['id']} ===\n{post['text']}" for post in posts)
+            messages = [
+                {"role": "system", "content": 'You are a master of information warfare, an expert in detecting propaganda, manipulation, and fake news.'},
+                {"role": "user", "content": CHANNEL_BATCH_PROMPT.format(channel_name=channel_name, posts=posts_text)}
+            ]
+            client = await self.get_client()
+            response = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=1,
+                response_format={"type": "json_object"}
+            )
+            result = json.loads(response.choices[0].message.content)
+            if not isinstance(result.get("posts"), list):
+                raise ValueError("response has no list of posts")
+            return result
+        except Exception as e:
+            logger.error(f"Error analyzing channel batch: {e}")
+            return None
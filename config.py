@@ -13,12 +13,56 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 # OpenAI Configuration
 OPENAI_MODEL = os.getenv('OPENAI_MODEL')
 
-# Validation
-if not TELEGRAM_BOT_TOKEN:
-    raise ValueError("TELEGRAM_BOT_TOKEN not found in environment variables")
+# Micro-batching Configuration
+MICRO_BATCH_ENABLED = os.getenv('MICRO_BATCH_ENABLED', 'false').lower() == 'true'  # batch short text analyses
+MICRO_BATCH_WAIT_MS = int(os.getenv('MICRO_BATCH_WAIT_MS', '300'))  # how long to collect a batch
+MICRO_BATCH_MAX_SIZE = int(os.getenv('MICRO_BATCH_MAX_SIZE', '5'))  # posts per batch
+MICRO_BATCH_MAX_CHARS = int(os.getenv('MICRO_BATCH_MAX_CHARS', '800'))  # longer posts are analyzed alone
+MICRO_BATCH_ITEM_MAX_LENGTH = int(os.getenv('MICRO_BATCH_ITEM_MAX_LENGTH', '1500'))  # characters per batched analysis
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
+# Link enrichment Configuration
+LINK_FETCH_TIMEOUT = float(os.getenv('LINK_FETCH_TIMEOUT', '5'))  # seconds per link
+LINK_MAX_BYTES = int(os.getenv('LINK_MAX_BYTES', '262144'))  # max downloaded bytes per page
+LINK_MAX_LINKS = int(os.getenv('LINK_MAX_LINKS', '5'))  # max links fetched per post
+LINK_CACHE_TTL = float(os.getenv('LINK_CACHE_TTL', '3600'))  # seconds
+LINK_CACHE_MAX_ENTRIES = int(os.getenv('LINK_CACHE_MAX_ENTRIES', '1000'))
 
-if not OPENAI_MODEL:
-    raise ValueError("OPENAI_MODEL not found in environment variables")
\ No newline at end of file
+# Follow-up conversation Configuration
+CONVERSATION_TTL = float(os.getenv('CONVERSATION_TTL', '21600'))  # seconds an analysis can be asked about
+CONVERSATION_MAX_ENTRIES = int(os.getenv('CONVERSATION_MAX_ENTRIES', '2000'))  # max remembered messages
+CONVERSATION_MAX_TURNS = int(os.getenv('CONVERSATION_MAX_TURNS', '5'))  # follow-ups kept per conversation
+
+# Admission control Configuration
+ANALYSIS_MAX_CONCURRENT = int(os.getenv('ANALYSIS_MAX_CONCURRENT', '4'))  # analyses running at the same time
+ANALYSIS_MAX_QUEUE = int(os.getenv('ANALYSIS_MAX_QUEUE', '50'))  # analyses waiting for a slot
+ANALYSIS_MAX_PER_USER = int(os.getenv('ANALYSIS_MAX_PER_USER', '2'))  # queued or running analyses per user
+ANALYSIS_MAX_PER_CHAT = int(os.getenv('ANALYSIS_MAX_PER_CHAT', '10'))  # queued or running analyses per chat
+ANALYSIS_QUEUE_REFRESH = float(os.getenv('ANALYSIS_QUEUE_REFRESH', '5'))  # seconds between queue position updates
+ANALYSIS_DROP_SUPERSEDED = os.getenv('ANALYSIS_DROP_SUPERSEDED', 'true').lower() == 'true'  # re-sent post replaces the queued request
+
+# Channel watch Configuration
+CHANNEL_WATCH_WINDOW = float(os.getenv('CHANNEL_WATCH_WINDOW', '600'))  # seconds of posts per digest
+CHANNEL_WATCH_MAX_POSTS = int(os.getenv('CHANNEL_WATCH_MAX_POSTS', '20'))  # posts per digest
+CHANNEL_WATCH_CHANNELS = [int(chat_id) for chat_id in os.getenv('CHANNEL_WATCH_CHANNELS', '').split(',') if chat_id.strip()]
+CHANNEL_WATCH_DIGEST_CHAT_ID = os.getenv('CHANNEL_WATCH_DIGEST_CHAT_ID')  # where digests go (default: the channel)
+CHANNEL_WATCH_FILE = os.getenv('CHANNEL_WATCH_FILE', 'watched_channels.json')  # channels subscribed with /watch
+
+# Shutdown Configuration
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '25'))  # seconds to finish running analyses
+HANDOFF_FILE = os.getenv('HANDOFF_FILE', 'handoff.json')  # unfinished updates for the next instance
+HANDOFF_POLL_INTERVAL = float(os.getenv('HANDOFF_POLL_INTERVAL', '5'))  # seconds between checks for handed off updates
+
+# Startup Configuration
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', '3'))  # seconds from process launch until the first update is handled (reply sent)
+
+
+def validate_config():
+    """Check that the required environment variables are set"""
+    if not TELEGRAM_BOT_TOKEN:
+        raise ValueError("TELEGRAM_BOT_TOKEN not found in environment variables")
+
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY not found in environment variables")
+
+    if not OPENAI_MODEL:
+        raise ValueError("OPENAI_MODEL not found in environment variables")
@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+
+from config import CONVERSATION_TTL, CONVERSATION_MAX_ENTRIES, CONVERSATION_MAX_TURNS
+
+POST_TEXT_MAX_LENGTH = 2000
+
+
+class ConversationStore:
+    """
+    Remembers analyzed posts so that follow-up questions can be answered
+    from a compact summary instead of re-sending the post and its images.
+
+    A conversation is reachable from every message that belongs to it: the
+    analyzed message(s), the bot's analysis and the follow-up questions and
+    answers. Keys are (chat_id, message_id), so conversations are per chat.
+    """
+
+    def __init__(self, ttl: float = CONVERSATION_TTL, max_entries: int = CONVERSATION_MAX_ENTRIES,
+                 max_turns: int = CONVERSATION_MAX_TURNS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_turns = max_turns
+        self.entries = OrderedDict()  # (chat_id, message_id) -> conversation
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, conversation in self.entries.items() if conversation['expires_at'] < now]
+        for key in expired:
+            del self.entries[key]
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _link(self, chat_id: int, message_ids: list, conversation: dict):
+        for message_id in message_ids:
+            if message_id is None:
+                continue
+            key = (chat_id, message_id)
+            self.entries[key] = conversation
+            self.entries.move_to_end(key)
+        self._evict()
+
+    def add(self, chat_id: int, message_ids: list, channel_name: str, post_text: str, analysis: str,
+            image_count: int = 0) -> dict:
+        """
+        Store an analysis
+
+        Args:
+            chat_id (int): Chat where the analysis was sent
+            message_ids (list): IDs of the analyzed message(s) and the bot's reply
+            channel_name (str): Channel the post came from
+            post_text (str): Text of the post (truncated for storage)
+            analysis (str): The bot's analysis
+            image_count (int): Number of images that were analyzed
+
+        Returns:
+            dict: The stored conversation
+        """
+        if len(post_text) > POST_TEXT_MAX_LENGTH:
+            post_text = post_text[:POST_TEXT_MAX_LENGTH] + "…"
+        conversation = {
+            'channel_name': channel_name,
+            'post_text': post_text,
+            'image_count': image_count,
+            'analysis': analysis,
+            'turns': [],  # (question, answer) pairs
+            'expires_at': time.monotonic() + self.ttl
+        }
+        self._link(chat_id, message_ids, conversation)
+        return conversation
+
+    def get(self, chat_id: int, message_id: int):
+        """Return the conversation a message belongs to, or None if unknown or expired"""
+        key = (chat_id, message_id)
+        conversation = self.entries.get(key)
+        if conversation is None:
+            return None
+        if conversation['expires_at'] < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return conversation
+
+    def add_turn(self, chat_id: int, message_ids: list, conversation: dict, question: str, answer: str):
+        """Append a follow-up question and answer and make their messages part of the conversation"""
+        conversation['turns'].append((question, answer))
+        del conversation['turns'][:-self.max_turns]
+        conversation['expires_at'] = time.monotonic() + self.ttl
+        self._link(chat_id, message_ids, conversation)
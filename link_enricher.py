@@ -0,0 +1,319 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from config import LINK_FETCH_TIMEOUT, LINK_MAX_BYTES, LINK_MAX_LINKS, LINK_CACHE_TTL, LINK_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# Telegram entity types that carry links
+URL_ENTITY_TYPES = ["url", "text_link"]
+
+# How long a failed fetch is remembered, so a dead link is not retried for every post
+FAILED_FETCH_TTL = 60
+
+LEAD_MAX_LENGTH = 300
+TITLE_MAX_LENGTH = 150
+
+MAX_REDIRECTS = 5
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+
+
+class _PageInfoParser(HTMLParser):
+    """Collects the title and the lead paragraph of an HTML page"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.og_title = ""
+        self.description = ""
+        self.lead = ""
+        self._in_title = False
+        self._in_paragraph = False
+        self._paragraph = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            content = (attrs.get("content") or "").strip()
+            if key == "og:title" and not self.og_title:
+                self.og_title = content
+            elif key in ("og:description", "description") and not self.description:
+                self.description = content
+        elif tag == "p" and not self.lead:
+            self._in_paragraph = True
+            self._paragraph = []
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "p" and self._in_paragraph:
+            self._in_paragraph = False
+            paragraph = " ".join("".join(self._paragraph).split())
+            # Skip cookie banners, bylines and other short fragments
+            if len(paragraph) >= 40:
+                self.lead = paragraph
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif self._in_paragraph:
+            self._paragraph.append(data)
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1].rstrip() + "…"
+
+
+async def resolve_host(host: str) -> list:
+    """Resolve a host name to the list of its IP addresses"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+async def check_url(url: str) -> str:
+    """
+    Make sure a URL may be fetched: only http(s) to public addresses, so that
+    users cannot make the bot read pages from its own host or network
+
+    Returns:
+        str: The checked IP address to connect to
+
+    Raises:
+        ValueError: If the URL is not allowed
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ValueError(f"scheme {parts.scheme!r} is not allowed")
+    if not parts.hostname:
+        raise ValueError("URL has no host")
+    addresses = await resolve_host(parts.hostname)
+    if not addresses:
+        raise ValueError(f"host {parts.hostname} does not resolve")
+    ips = []
+    for address in addresses:
+        # Strip the IPv6 zone index (e.g. fe80::1%eth0)
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if (not ip.is_global or ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+                or ip.is_multicast or ip.is_unspecified):
+            raise ValueError(f"host {parts.hostname} resolves to non-public address {ip}")
+        ips.append(ip)
+    return str(ips[0])
+
+
+def extract_urls(message) -> list:
+    """
+    Extract URLs from the text and caption entities of a message
+
+    Args:
+        message: Telegram message (or a mock message without entities)
+
+    Returns:
+        list: Unique URLs in order of appearance
+    """
+    urls = []
+    for parser_name in ("parse_entities", "parse_caption_entities"):
+        parser = getattr(message, parser_name, None)
+        if not parser:
+            continue
+        try:
+            entities = parser(URL_ENTITY_TYPES)
+        except Exception as e:
+            logger.warning(f"Error parsing message entities: {e}")
+            continue
+        for entity, text in entities.items():
+            url = entity.url if entity.type == "text_link" else text
+            if not url:
+                continue
+            if "://" not in url:
+                url = "http://" + url
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+
+class LinkEnricher:
+    def __init__(self, timeout: float = LINK_FETCH_TIMEOUT, max_bytes: int = LINK_MAX_BYTES,
+                 max_links: int = LINK_MAX_LINKS, cache_ttl: float = LINK_CACHE_TTL,
+                 cache_max_entries: int = LINK_CACHE_MAX_ENTRIES, transport=None):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_links = max_links
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.cache = OrderedDict()  # url -> (expires_at, page info or None)
+        self.in_flight = {}  # url -> task, so concurrent posts share one fetch
+        self.transport = transport  # Custom httpx transport (optional)
+        self.client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                # Redirects are followed in _download, so that every hop is checked
+                follow_redirects=False,
+                # Requests go to pinned IP addresses, so a pooled TLS connection must never be reused for
+                # another host name on the same address
+                limits=httpx.Limits(max_keepalive_connections=0),
+                transport=self.transport,
+                headers={"User-Agent": "Mozilla/5.0 (compatible; PostAnalyzerBot/1.0)"}
+            )
+        return self.client
+
+    async def close(self):
+        """Close the underlying HTTP client"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _get_cached(self, url: str):
+        entry = self.cache.get(url)
+        if entry is None:
+            return False, None
+        expires_at, info = entry
+        if expires_at < time.monotonic():
+            del self.cache[url]
+            return False, None
+        self.cache.move_to_end(url)
+        return True, info
+
+    def _store(self, url: str, info):
+        ttl = self.cache_ttl if info else min(self.cache_ttl, FAILED_FETCH_TTL)
+        self.cache[url] = (time.monotonic() + ttl, info)
+        self.cache.move_to_end(url)
+        while len(self.cache) > self.cache_max_entries:
+            self.cache.popitem(last=False)
+
+    async def _download(self, url: str):
+        """Download at most max_bytes of an HTML page and extract its title and lead"""
+        client = self._get_client()
+        for _ in range(MAX_REDIRECTS + 1):
+            address = await check_url(url)
+            # Connect to the checked address instead of letting httpx resolve the host again,
+            # which a short-lived DNS record could point at a private address by then
+            target = httpx.URL(url)
+            extensions = {"sni_hostname": target.host} if target.scheme == "https" else {}
+            async with client.stream("GET", target.copy_with(host=address), headers={"Host": target.netloc.decode()},
+                                     extensions=extensions) as response:
+                location = response.headers.get("location")
+                if response.status_code in REDIRECT_STATUS_CODES and location:
+                    url = urljoin(url, location)
+                    continue
+                if response.status_code >= 400:
+                    logger.info(f"Link {url} returned HTTP {response.status_code}")
+                    return None
+                content_type = response.headers.get("content-type", "")
+                if "html" not in content_type:
+                    return {"title": "", "lead": f"[{content_type.split(';')[0] or 'unknown content'}]"}
+
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) >= self.max_bytes:
+                        break
+                encoding = response.charset_encoding or "utf-8"
+                break
+        else:
+            logger.info(f"Too many redirects for link {url}")
+            return None
+
+        parser = _PageInfoParser()
+        try:
+            parser.feed(bytes(body[:self.max_bytes]).decode(encoding, errors="replace"))
+        except Exception as e:
+            logger.warning(f"Error parsing page {url}: {e}")
+        title = parser.og_title or parser.title
+        lead = parser.description or parser.lead
+        if not title and not lead:
+            return None
+        return {"title": _shorten(title, TITLE_MAX_LENGTH), "lead": _shorten(lead, LEAD_MAX_LENGTH)}
+
+    async def _fetch(self, url: str):
+        try:
+            info = await asyncio.wait_for(self._download(url), self.timeout)
+        except Exception as e:
+            logger.info(f"Could not fetch link {url}: {e}")
+            info = None
+        self._store(url, info)
+        return info
+
+    async def fetch(self, url: str):
+        """
+        Get the title and lead paragraph of a page, using the cache when possible
+
+        Args:
+            url (str): Page URL
+
+        Returns:
+            dict: {"title": ..., "lead": ...} or None if the page could not be fetched
+        """
+        found, info = self._get_cached(url)
+        if found:
+            return info
+
+        task = self.in_flight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url))
+            self.in_flight[url] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def summarize_urls(self, urls: list) -> str:
+        """
+        Fetch the given URLs concurrently and build a compact summary for the prompt
+
+        Args:
+            urls (list): URLs to describe
+
+        Returns:
+            str: One line per link, or an empty string if there are no links
+        """
+        urls = urls[:self.max_links]
+        if not urls:
+            return ""
+
+        results = await asyncio.gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+
+        lines = []
+        for url, info in zip(urls, results):
+            if isinstance(info, BaseException) or not info:
+                lines.append(f"- {url} — (could not be fetched)")
+            elif info["title"] and info["lead"]:
+                lines.append(f"- {url} — {info['title']}: {info['lead']}")
+            else:
+                lines.append(f"- {url} — {info['title'] or info['lead']}")
+        return "\n".join(lines)
+
+    async def summarize_messages(self, messages: list) -> str:
+        """
+        Build a link summary for all URLs found in the given messages
+
+        Args:
+            messages (list): Telegram messages (e.g. a single post or a media group)
+
+        Returns:
+            str: Link summary, or an empty string if the messages contain no links
+        """
+        urls = []
+        for message in messages:
+            for url in extract_urls(message):
+                if url not in urls:
+                    urls.append(url)
+        try:
+            return await self.summarize_urls(urls)
+        except Exception as e:
+            logger.error(f"Error enriching links: {e}")
+            return ""
@@ -0,0 +1,62 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age() -> float:
+    """Seconds since the process was launched (Linux only, 0 elsewhere)"""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces, so split after the closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except Exception:
+        return 0.0
+
+
+# Reference point for all startup timings: the process launch, not the first import of this module
+_age = _process_age()
+PROCESS_START = time.monotonic() - _age
+# The same moment as a Unix timestamp, to compare with message dates
+PROCESS_START_TIME = time.time() - _age
+
+
+class StartupProfiler:
+    def __init__(self, budget: float = 0.0, enabled: bool = False):
+        self.budget = budget
+        self.enabled = enabled
+        self.phases = []  # (phase name, seconds since process launch)
+
+    def elapsed(self) -> float:
+        """Seconds since the process was launched"""
+        return time.monotonic() - PROCESS_START
+
+    def mark(self, phase: str):
+        """Record that a startup phase has finished"""
+        elapsed = self.elapsed()
+        self.phases.append((phase, elapsed))
+        if self.enabled:
+            logger.info(f"[startup] {phase}: {elapsed * 1000:.0f} ms")
+
+    def report(self, check_budget: bool = True):
+        """Log the duration of every recorded phase and compare the total with the budget"""
+        if not self.phases:
+            return
+        lines = ["Startup profile:"]
+        previous = 0.0
+        for phase, elapsed in self.phases:
+            lines.append(f"  {phase:<28} +{(elapsed - previous) * 1000:7.0f} ms  (at {elapsed * 1000:.0f} ms)")
+            previous = elapsed
+        total = self.phases[-1][1]
+        if self.budget and check_budget:
+            status = "within" if total <= self.budget else "OVER"
+            lines.append(f"  Total {total * 1000:.0f} ms, {status} budget of {self.budget * 1000:.0f} ms")
+        logger.info("\n".join(lines))
+
+
+startup_profiler = StartupProfiler()
@@ -1,13 +1,26 @@
+import argparse
 import asyncio
+import json
 import logging
+import os
 import re
+import signal
+
+# Imported before the SDKs so that their import time shows up in the startup profile
+from startup import startup_profiler, PROCESS_START_TIME
 
 from telegram import Update
 from telegram.constants import ParseMode
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes
 
 from chatgpt_analyzer import ChatGPTAnalyzer
-from config import TELEGRAM_BOT_TOKEN, OPENAI_MODEL
+from admission import AdmissionController, AdmissionRejected, RequestSuperseded
+from channel_watch import ChannelWatcher
+from config import (TELEGRAM_BOT_TOKEN, OPENAI_MODEL, STARTUP_BUDGET, SHUTDOWN_DRAIN_TIMEOUT, HANDOFF_FILE,
+                    HANDOFF_POLL_INTERVAL,
+                    CHANNEL_WATCH_DIGEST_CHAT_ID, ANALYSIS_QUEUE_REFRESH, validate_config)
+from conversation_store import ConversationStore
+from link_enricher import LinkEnricher
 
 # Configure logging
 logging.basicConfig(
@@ -35,19 +48,77 @@ def escape_markdown_v2(text: str) -> str:
     # return re.sub(f"([{re.escape(escape_chars)}])", r"\\\1", text)
 
 
+# Scores of a post in a channel digest, in display order
+CHANNEL_SCORE_KEYS = ["propaganda", "falsehood", "populism", "emotional_manipulation", "toxicity", "war_panic",
+                      "shitposting"]
+CHANNEL_POST_MAX_LENGTH = 1500  # characters of each post sent in a channel batch
+TELEGRAM_MESSAGE_MAX_LENGTH = 4096
+
+
+def request_key(update):
+    """
+    Identity of the content a request is about, so that sending the same post
+    again supersedes the queued request while different posts do not
+    """
+    message = update.effective_message
+    origin = getattr(message, 'forward_origin', None)
+    if origin is not None:
+        # Channel posts have a chat and message id; forwards from users only a date
+        chat = getattr(origin, 'chat', None)
+        if chat is not None and getattr(origin, 'message_id', None):
+            return ('forward', chat.id, origin.message_id)
+        return ('forward', origin.date, message.text or message.caption)
+    if message.reply_to_message:
+        return ('reply', message.reply_to_message.message_id, message.text)
+    return ('text', message.text or message.caption)
+
+
+def is_analysis_error(analysis: str) -> bool:
+    """Check whether an analysis is an error message rather than a model answer"""
+    return analysis.startswith(("❌", "Error analyzing", "Вибачте, сталася помилка"))
+
+
 class TelegramBot:
-    def __init__(self):
+    def __init__(self, fast_start: bool = False):
+        # Clients are created lazily, so constructing the bot is cheap
         self.analyzer = ChatGPTAnalyzer()
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        self.link_enricher = LinkEnricher()
+        self.conversations = ConversationStore()  # Analyzed posts, for follow-up questions
+        self.admission = AdmissionController()  # Quotas and queue for analyses
+        self.channel_watcher = ChannelWatcher(self.start_channel_batch)  # Batched digests of watched channels
+        self.application = None  # Built in run()
         self.media_groups = {}  # Store media groups being processed
         self.bot_id = None  # Will be set at startup
+        self.fast_start = fast_start  # Warm up the OpenAI client in the background while polling starts
+        self.first_update_seen = False
+        self.first_reply_sent = False
+        self.warm_up_task = None
+        self.jobs = []  # Admitted analyses: {'updates', 'task', 'started'}
+        self.draining = False  # Set on shutdown; new analyses are handed off instead of started
+        self.handoff = []  # Updates left for the next instance
+        self.handoff_task = None  # Picks up updates handed off by other instances
+        self.handed_off_media_groups = set()  # Albums the user was already told about during shutdown
+
+    def build_application(self) -> Application:
+        """Build the Telegram application and register the handlers"""
+        # Updates are handled concurrently; AdmissionController bounds the number of running analyses
+        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).build()
         self.setup_handlers()
+        return self.application
 
     def setup_handlers(self):
         """Setup message handlers for the bot"""
+        # Observe the first update for the startup profile (runs before all other handlers)
+        if startup_profiler.enabled or self.fast_start:
+            self.application.add_handler(TypeHandler(Update, self.record_first_update), group=-1)
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
+        # Channel watch commands, posted in the channel by its admins
+        self.application.add_handler(CommandHandler("watch", self.watch_command,
+                                                    filters=filters.UpdateType.CHANNEL_POST))
+        self.application.add_handler(CommandHandler("unwatch", self.unwatch_command,
+                                                    filters=filters.UpdateType.CHANNEL_POST))
         # Message handlers for forwarded messages and channel posts (private chats only)
         self.application.add_handler(MessageHandler(
             filters.FORWARDED & filters.ChatType.PRIVATE,
@@ -68,6 +139,42 @@ class TelegramBot:
             filters.ChatType.CHANNEL & filters.TEXT & filters.Entity("mention"),
             self.handle_channel_mention
         ))
+        # Posts of watched channels, in a separate group so that mentions are buffered too
+        self.application.add_handler(MessageHandler(
+            filters.UpdateType.CHANNEL_POST & ~filters.COMMAND,
+            self.handle_channel_post
+        ), group=1)
+
+    async def record_first_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Record how long after process launch the first update arrived"""
+        if self.first_update_seen:
+            return
+        self.first_update_seen = True
+        startup_profiler.mark("first update received")
+
+    def record_first_reply(self, update: Update):
+        """Record how long after process launch the first update was handled and check the startup budget"""
+        if self.first_reply_sent:
+            return
+        self.first_reply_sent = True
+        startup_profiler.mark("first update handled")
+        # Only an update that was already waiting at launch measures the startup; a later one
+        # measures how long the bot waited for users
+        message = update.effective_message
+        pending_at_launch = bool(message and message.date and message.date.timestamp() <= PROCESS_START_TIME)
+        if startup_profiler.enabled:
+            startup_profiler.report(check_budget=pending_at_launch)
+        if pending_at_launch and startup_profiler.budget and startup_profiler.elapsed() > startup_profiler.budget:
+            logger.warning(f"First update handled {startup_profiler.elapsed():.2f}s after launch, "
+                           f"startup budget is {startup_profiler.budget:.2f}s")
+
+    async def warm_up(self):
+        """Import the OpenAI SDK and create the client without blocking the event loop"""
+        try:
+            await self.analyzer.get_client()
+            startup_profiler.mark("openai client ready")
+        except Exception as e:
+            logger.error(f"Error warming up the OpenAI client: {e}")
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -95,6 +202,7 @@ I can analyze posts shared from any channel using AI.
 Let's get started! Forward a post from any channel to me.
         """
         await update.message.reply_text(welcome_message)
+        self.record_first_reply(update)
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
@@ -132,6 +240,7 @@ I analyze posts shared from channels using ChatGPT to provide:
 **Note:** Make sure you have permission to share the content you're analyzing.
         """
         await update.message.reply_text(help_message)
+        self.record_first_reply(update)
 
     async def handle_forwarded_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle forwarded messages from channels"""
@@ -148,15 +257,24 @@ I analyze posts shared from channels using ChatGPT to provide:
 
             # Check if this is part of a media group
             if message.media_group_id:
+                # Albums arriving during shutdown go to the next instance
+                if self.draining:
+                    self.hand_off([update])
+                    if message.media_group_id not in self.handed_off_media_groups:
+                        self.handed_off_media_groups.add(message.media_group_id)
+                        await message.reply_text("♻️ Бот перезапускається, запит буде оброблено після перезапуску.")
+                    return
+
                 # This is part of a media group - store it and wait for more
                 if message.media_group_id not in self.media_groups:
                     self.media_groups[message.media_group_id] = {
                         'messages': [],
-                        'processed': False,
+                        'updates': [],
                         'timer': None
                     }
 
                 self.media_groups[message.media_group_id]['messages'].append(message)
+                self.media_groups[message.media_group_id]['updates'].append(update)
 
                 # Set a timer to process the group after a short delay
                 if self.media_groups[message.media_group_id]['timer']:
@@ -168,7 +286,7 @@ I analyze posts shared from channels using ChatGPT to provide:
                 return
 
             # Regular message (not part of a media group) - process immediately
-            await self.process_single_message(message, context)
+            await self.run_admitted([update], message, self.process_single_message, message, context)
 
         except Exception as e:
             logger.error(f"Error handling forwarded message: {e}")
@@ -180,19 +298,18 @@ I analyze posts shared from channels using ChatGPT to provide:
             # Wait 2 seconds for all messages in the group to arrive
             await asyncio.sleep(2)
 
-            if media_group_id in self.media_groups and not self.media_groups[media_group_id]['processed']:
-                messages = self.media_groups[media_group_id]['messages']
-                if messages:
-                    # Process the first message as the representative
-                    await self.process_media_group(messages, context)
-
-                # Clean up
-                del self.media_groups[media_group_id]
+            # Take the group out of the buffer, so late messages start a new group instead of cancelling this one
+            media_group = self.media_groups.pop(media_group_id, None)
+            if media_group and media_group['messages']:
+                messages = media_group['messages']
+                # Process the first message as the representative
+                await self.run_admitted(media_group['updates'], messages[0], self.process_media_group, messages,
+                                        context)
 
         except Exception as e:
             logger.error(f"Error processing media group: {e}")
 
-    async def process_media_group(self, messages: list, context: ContextTypes.DEFAULT_TYPE):
+    async def process_media_group(self, messages: list, context: ContextTypes.DEFAULT_TYPE, processing_msg=None):
         """Process a group of media messages"""
         try:
             first_message = messages[0]
@@ -206,7 +323,8 @@ I analyze posts shared from channels using ChatGPT to provide:
                 channel_info = "Unknown Channel"
 
             # Send processing message
-            processing_msg = await first_message.reply_text("🔍 Аналізую пост... Очікуйте.")
+            if not processing_msg:
+                processing_msg = await first_message.reply_text("🔍 Аналізую пост... Очікуйте.")
 
             all_image_urls = []
             all_texts = []
@@ -227,13 +345,15 @@ I analyze posts shared from channels using ChatGPT to provide:
                     all_texts.append(msg.text)
 
             post_text = "\n".join(all_texts).strip()
+            links_summary = await self.link_enricher.summarize_messages(messages)
 
             if all_image_urls:
                 analysis = await self.analyzer.analyze_image_post(
                     image_urls=all_image_urls,
                     post_text=post_text,
                     caption=caption,
-                    channel_name=channel_info
+                    channel_name=channel_info,
+                    links_summary=links_summary
                 )
             else:
                 analysis = "❌ Не вдалося отримати зображення для аналізу."
@@ -245,14 +365,16 @@ I analyze posts shared from channels using ChatGPT to provide:
             # Delete processing message and send analysis
             await processing_msg.delete()
             try:
-                await first_message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
+                sent_msg = await first_message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
             except Exception as e:
                 logger.warning(f"HTML parsing failed, sending as plain text: {e}")
-                await first_message.reply_text(formatted_answer, parse_mode=None)
+                sent_msg = await first_message.reply_text(formatted_answer, parse_mode=None)
 
-            # Mark as processed
-            if first_message.media_group_id in self.media_groups:
-                self.media_groups[first_message.media_group_id]['processed'] = True
+            # Remember the analysis for follow-up questions
+            if all_image_urls and not is_analysis_error(analysis):
+                self.conversations.add(first_message.chat_id,
+                                       [msg.message_id for msg in messages] + [sent_msg.message_id],
+                                       channel_info, post_text, analysis, image_count=len(all_image_urls))
 
         except Exception as e:
             logger.error(f"Error processing media group: {e}")
@@ -290,7 +412,7 @@ I analyze posts shared from channels using ChatGPT to provide:
             return ""
 
     async def process_single_message(self, message, context: ContextTypes.DEFAULT_TYPE, original_message=None,
-                                     custom_prompt: str = ""):
+                                     custom_prompt: str = "", processing_msg=None):
         """Process a single message (not part of a media group)"""
         try:
             # Use original_message for sending replies if provided (for mock messages)
@@ -305,12 +427,17 @@ I analyze posts shared from channels using ChatGPT to provide:
                 channel_info = "Unknown Channel"
 
             # Send processing message
-            processing_msg = await reply_message.reply_text("🔍 Аналізую пост... Очікуйте.")
+            if not processing_msg:
+                processing_msg = await reply_message.reply_text("🔍 Аналізую пост... Очікуйте.")
+
+            # Fetch titles and lead paragraphs of linked pages
+            links_summary = await self.link_enricher.summarize_messages([message])
 
             # Analyze based on content type
+            image_count = 0
             if message.text and not message.photo and not message.video and not message.document and not message.audio and not message.voice and not message.video_note:
                 # Pure text message
-                analysis = await self.analyzer.analyze_post(message.text, channel_info, custom_prompt)
+                analysis = await self.analyzer.analyze_post(message.text, channel_info, custom_prompt, links_summary)
             elif message.photo:
                 # Single image post - use ChatGPT Vision API
                 image_urls = []
@@ -318,18 +445,20 @@ I analyze posts shared from channels using ChatGPT to provide:
                     url = await self.get_image_url(photo.file_id, context)
                     if url:
                         image_urls.append(url)
+                image_count = len(image_urls)
                 if image_urls:
                     analysis = await self.analyzer.analyze_image_post(image_urls=image_urls,
                                                                       post_text=message.text if message.text else "",
                                                                       caption=message.caption if message.caption else "",
                                                                       channel_name=channel_info,
-                                                                      custom_prompt=custom_prompt)
+                                                                      custom_prompt=custom_prompt,
+                                                                      links_summary=links_summary)
                 else:
                     analysis = "❌ Не вдалося отримати зображення для аналізу."
             elif message.caption and (
                     message.video or message.document or message.audio or message.voice or message.video_note):
                 # Other media types with caption - analyze only the text
-                analysis = await self.analyzer.analyze_post(message.caption, channel_info, custom_prompt)
+                analysis = await self.analyzer.analyze_post(message.caption, channel_info, custom_prompt, links_summary)
             else:
                 # Unsupported media without text
                 analysis = "❌ Цей тип медіа не підтримується для аналізу. Надішліть текст або зображення."
@@ -342,11 +471,18 @@ I analyze posts shared from channels using ChatGPT to provide:
             # Delete processing message and send analysis
             await processing_msg.delete()
             try:
-                await reply_message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
+                sent_msg = await reply_message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
             except Exception as e:
                 # If HTML parsing fails, send without formatting
                 logger.warning(f"HTML parsing failed, sending as plain text: {e}")
-                await reply_message.reply_text(formatted_answer, parse_mode=None)
+                sent_msg = await reply_message.reply_text(formatted_answer, parse_mode=None)
+
+            # Remember the analysis for follow-up questions (mock messages have no message_id)
+            if not is_analysis_error(analysis):
+                self.conversations.add(reply_message.chat_id,
+                                       [getattr(message, 'message_id', None), sent_msg.message_id],
+                                       channel_info, message.text or message.caption or "", analysis,
+                                       image_count=image_count)
 
         except Exception as e:
             logger.error(f"Error processing single message: {e}")
@@ -364,11 +500,30 @@ I analyze posts shared from channels using ChatGPT to provide:
             if not message:
                 return
 
+            # A reply to an analyzed post or to one of the bot's answers is a follow-up question
+            if message.reply_to_message:
+                conversation = self.conversations.get(message.chat_id, message.reply_to_message.message_id)
+                if conversation:
+                    await self.run_admitted([update], message, self.answer_follow_up, message, conversation,
+                                            message.text)
+                    return
+
+            await self.run_admitted([update], message, self.process_text_message, message)
+
+        except Exception as e:
+            logger.error(f"Error handling text message: {e}")
+            await message.reply_text("❌ Вибачте, сталася помилка при аналізі тексту. Спробуйте ще раз.")
+
+    async def process_text_message(self, message, processing_msg=None):
+        """Analyze a text message sent directly to the bot"""
+        try:
             # Send processing message
-            processing_msg = await message.reply_text("🔍 Аналізую пост... Очікуйте.")
+            if not processing_msg:
+                processing_msg = await message.reply_text("🔍 Аналізую пост... Очікуйте.")
 
             # Analyze the text
-            analysis = await self.analyzer.analyze_post(message.text, "Direct Message")
+            links_summary = await self.link_enricher.summarize_messages([message])
+            analysis = await self.analyzer.analyze_post(message.text, "Direct Message", links_summary=links_summary)
 
             formatted_answer = self.format_analysis(analysis)
 
@@ -378,16 +533,250 @@ I analyze posts shared from channels using ChatGPT to provide:
             # Delete processing message and send analysis
             await processing_msg.delete()
             try:
-                await message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
+                sent_msg = await message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
             except Exception as e:
                 # If HTML parsing fails, send without formatting
                 logger.warning(f"Markdown V2 parsing failed, sending as plain text: {e}")
-                await message.reply_text(analysis, parse_mode=None)
+                sent_msg = await message.reply_text(analysis, parse_mode=None)
+
+            # Remember the analysis for follow-up questions
+            if not is_analysis_error(analysis):
+                self.conversations.add(message.chat_id, [message.message_id, sent_msg.message_id],
+                                       "Direct Message", message.text, analysis)
 
         except Exception as e:
-            logger.error(f"Error handling text message: {e}")
+            logger.error(f"Error processing text message: {e}")
             await message.reply_text("❌ Вибачте, сталася помилка при аналізі тексту. Спробуйте ще раз.")
 
+    async def run_admitted(self, updates: list, message, process, *args, **kwargs):
+        """
+        Run an analysis through admission control
+
+        The user sees their queue position in the processing message, which is
+        then passed on to the analysis as processing_msg. The updates that
+        caused the analysis are handed off to the next instance if the bot
+        shuts down before the analysis is done.
+        """
+        if self.draining:
+            self.hand_off(updates)
+            await message.reply_text("♻️ Бот перезапускається, запит буде оброблено після перезапуску.")
+            return
+
+        user = getattr(message, 'from_user', None)
+        user_id = user.id if user else message.chat_id
+        try:
+            ticket = self.admission.submit(user_id, message.chat_id, request_key(updates[0]))
+        except AdmissionRejected as e:
+            logger.info(f"Request of user {user_id} in chat {message.chat_id} rejected: {e}")
+            await message.reply_text(str(e))
+            return
+
+        job = {'updates': updates, 'task': asyncio.current_task(), 'started': False}
+        self.jobs.append(job)
+        processing_msg = None
+        try:
+            position = self.admission.position(ticket)
+            if position:
+                processing_msg = await message.reply_text(f"⏳ Ваш запит {position}-й у черзі. Очікуйте.")
+            else:
+                processing_msg = await message.reply_text("🔍 Аналізую пост... Очікуйте.")
+
+            try:
+                position = await self.wait_in_queue(ticket, processing_msg, position)
+            except RequestSuperseded:
+                await processing_msg.edit_text("⏭ Запит замінено новішим.")
+                return
+            job['started'] = True
+
+            if position:
+                await processing_msg.edit_text("🔍 Аналізую пост... Очікуйте.")
+            await process(*args, processing_msg=processing_msg, **kwargs)
+            self.record_first_reply(updates[0])
+        except asyncio.CancelledError:
+            # Cancelled by drain(), which has already handed the updates off
+            if self.draining and processing_msg:
+                try:
+                    await processing_msg.edit_text("♻️ Бот перезапускається, запит буде оброблено після перезапуску.")
+                except Exception as e:
+                    logger.warning(f"Error updating processing message on shutdown: {e}")
+            raise
+        finally:
+            self.jobs.remove(job)
+            self.admission.release(ticket)
+
+    async def wait_in_queue(self, ticket, processing_msg, position: int) -> int:
+        """
+        Wait for the ticket's turn, updating the queue position in the processing
+        message at most every ANALYSIS_QUEUE_REFRESH seconds
+
+        Returns:
+            int: The last position shown to the user (0 if the request never waited)
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self.admission.wait(ticket), ANALYSIS_QUEUE_REFRESH)
+                return position
+            except asyncio.TimeoutError:
+                new_position = self.admission.position(ticket)
+                if new_position and new_position != position:
+                    position = new_position
+                    try:
+                        await processing_msg.edit_text(f"⏳ Ваш запит {position}-й у черзі. Очікуйте.")
+                    except Exception as e:
+                        logger.warning(f"Error updating queue position: {e}")
+
+    def hand_off(self, updates: list):
+        """Leave updates for the next instance instead of processing them"""
+        self.handoff.extend(updates)
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        """
+        Finish running analyses and hand everything else off to the next instance
+
+        Queued analyses and buffered media groups are handed off right away.
+        Running analyses get until the deadline to finish; the rest are
+        cancelled and handed off, so no analysis is both sent and repeated.
+        The handoff file is written by run() once the application has stopped,
+        because updates still in flight may be handed off until then.
+        """
+        self.draining = True
+
+        for media_group in self.media_groups.values():
+            if media_group['timer']:
+                media_group['timer'].cancel()
+            self.hand_off(media_group['updates'])
+        self.media_groups.clear()
+        self.hand_off(self.channel_watcher.take_buffered_updates())
+
+        for job in list(self.jobs):
+            if not job['started']:
+                self.hand_off(job['updates'])
+                job['task'].cancel()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        running = [job for job in self.jobs if job['started']]
+        logger.info(f"Draining {len(running)} running analyses (up to {timeout:.0f}s)...")
+        while any(job['started'] for job in self.jobs) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+
+        for job in list(self.jobs):
+            if job['started'] and not job['task'].done():
+                logger.warning("Analysis did not finish before the drain deadline, handing it off")
+                self.hand_off(job['updates'])
+                job['task'].cancel()
+
+    def claim_handoff(self) -> list:
+        """
+        Take over HANDOFF_FILE and return the updates in it
+
+        The file is first renamed to a name of this process, so when two
+        instances reach for it at the same time only one of them gets it.
+        """
+        claimed_file = f"{HANDOFF_FILE}.{os.getpid()}"
+        try:
+            os.replace(HANDOFF_FILE, claimed_file)
+        except FileNotFoundError:
+            return []
+        try:
+            with open(claimed_file, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading handed off updates: {e}")
+            return []
+        finally:
+            # Removed before processing, so a crash while processing does not repeat the analyses
+            os.remove(claimed_file)
+
+    def save_handoff(self):
+        """Write the handed off updates to HANDOFF_FILE for the next instance"""
+        if not self.handoff:
+            return
+        try:
+            data = [update.to_dict() for update in self.handoff]
+            # Keep the updates of an earlier instance that no instance has picked up yet
+            data = self.claim_handoff() + data
+            tmp_file = f"{HANDOFF_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            # Replace atomically, so the next instance never reads a partial file
+            os.replace(tmp_file, HANDOFF_FILE)
+            logger.info(f"Handed off {len(data)} updates to {HANDOFF_FILE}")
+        except Exception as e:
+            logger.error(f"Error saving handed off updates: {e}")
+
+    async def load_handoff(self):
+        """Queue the updates handed off by another instance"""
+        try:
+            data = self.claim_handoff()
+            for update_data in data:
+                await self.application.update_queue.put(Update.de_json(update_data, self.application.bot))
+            if data:
+                logger.info(f"Resuming {len(data)} updates handed off by another instance")
+        except Exception as e:
+            logger.error(f"Error loading handed off updates: {e}")
+
+    async def watch_handoff(self):
+        """
+        Keep picking up handed off updates while the bot runs
+
+        In a rolling deploy the old instance writes HANDOFF_FILE only after
+        this one has started, so checking once at startup is not enough.
+        """
+        while True:
+            await asyncio.sleep(HANDOFF_POLL_INTERVAL)
+            await self.load_handoff()
+
+    async def process_general_question(self, message, processing_msg=None):
+        """Answer a mention that is not about a post as a general assistant"""
+        try:
+            if not processing_msg:
+                processing_msg = await message.reply_text("🔍 Аналізую пост... Очікуйте.")
+
+            answer = await self.analyzer.answer_general_question(message.text)
+            formatted_answer = self.format_analysis(answer)
+
+            logger.info("Answer: " + answer)
+            logger.info("Formatted Answer: " + formatted_answer)
+
+            await processing_msg.delete()
+            try:
+                await message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
+            except Exception as e:
+                logger.warning(f"Markdown V2 parsing failed, sending as plain text: {e}")
+                await message.reply_text(formatted_answer, parse_mode=None)
+
+        except Exception as e:
+            logger.error(f"Error answering general question: {e}")
+            await message.reply_text("❌ Вибачте, сталася помилка. Спробуйте ще раз.")
+
+    async def answer_follow_up(self, message, conversation: dict, question: str, processing_msg=None):
+        """Answer a question about an already analyzed post from its stored summary, without re-sending media"""
+        try:
+            if not processing_msg:
+                processing_msg = await message.reply_text("🔍 Аналізую пост... Очікуйте.")
+
+            answer = await self.analyzer.answer_follow_up(question, conversation)
+            formatted_answer = self.format_analysis(answer)
+
+            logger.info("Follow-up answer: " + answer)
+
+            await processing_msg.delete()
+            try:
+                sent_msg = await message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
+            except Exception as e:
+                logger.warning(f"Markdown V2 parsing failed, sending as plain text: {e}")
+                sent_msg = await message.reply_text(formatted_answer, parse_mode=None)
+
+            # Failed answers are not kept, so the next follow-up does not see them as history
+            if not is_analysis_error(answer):
+                self.conversations.add_turn(message.chat_id, [message.message_id, sent_msg.message_id],
+                                            conversation, question, answer)
+
+        except Exception as e:
+            logger.error(f"Error answering follow-up question: {e}")
+            await message.reply_text("❌ Вибачте, сталася помилка. Спробуйте ще раз.")
+
     async def get_image_url(self, file_id: str, context: ContextTypes.DEFAULT_TYPE) -> str:
         """Get the URL of an image file from Telegram"""
         try:
@@ -421,6 +810,34 @@ I analyze posts shared from channels using ChatGPT to provide:
         """Format the analysis for better presentation (HTML version)"""
         return escape_markdown_v2(analysis).strip()
 
+    async def handle_follow_up_mention(self, update: Update, message, bot_username: str) -> bool:
+        """
+        Handle a mention that replies to an already analyzed post or to the bot's answer
+
+        Returns:
+            bool: True if the mention was handled as a follow-up
+        """
+        if not message.reply_to_message:
+            return False
+        conversation = self.conversations.get(message.chat_id, message.reply_to_message.message_id)
+        if not conversation:
+            return False
+
+        question = self.extract_custom_prompt(message.text, bot_username)
+        if question:
+            logger.info(f"Follow-up question on analyzed post: '{question}'")
+            await self.run_admitted([update], message, self.answer_follow_up, message, conversation, question)
+        else:
+            # Plain mention of an analyzed post: repeat the stored analysis instead of analyzing it again
+            logger.info("Post already analyzed, sending stored analysis")
+            formatted_answer = self.format_analysis(conversation['analysis'])
+            try:
+                await message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
+            except Exception as e:
+                logger.warning(f"Markdown V2 parsing failed, sending as plain text: {e}")
+                await message.reply_text(formatted_answer, parse_mode=None)
+        return True
+
     async def handle_group_mention(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle messages in groups where the bot is mentioned"""
         try:
@@ -435,6 +852,9 @@ I analyze posts shared from channels using ChatGPT to provide:
                                                     entity.offset:entity.offset + entity.length].lower() == f"@{bot_username.lower()}"
                        for entity in message.entities or []):
                 return
+            # Follow-up question about an analyzed post or one of the bot's answers
+            if await self.handle_follow_up_mention(update, message, bot_username):
+                return
             # Ignore if replying to the bot's own message
             if message.reply_to_message and self.bot_id and getattr(message.reply_to_message.from_user, 'id',
                                                                     None) == self.bot_id:
@@ -486,15 +906,10 @@ I analyze posts shared from channels using ChatGPT to provide:
             else:
                 # No reply or quote: answer as a general assistant
                 logger.info("No reply or quote detected, answering as a general assistant")
-                answer = await self.analyzer.answer_general_question(message.text)
-                formatted_answer = self.format_analysis(answer)
-
-                logger.info("Answer: " + answer)
-                logger.info("Formatted Answer: " + formatted_answer)
-                await message.reply_text(formatted_answer, parse_mode=ParseMode.MARKDOWN_V2)
+                await self.run_admitted([update], message, self.process_general_question, message)
                 return
-            await self.process_single_message(target_message, context, original_message=message,
-                                              custom_prompt=custom_prompt)
+            await self.run_admitted([update], message, self.process_single_message, target_message, context,
+                                    original_message=message, custom_prompt=custom_prompt)
         except Exception as e:
             logger.error(f"Error handling group mention: {e}")
             await update.message.reply_text("❌ Вибачте, сталася помилка при аналізі згаданого поста. Спробуйте ще раз.")
@@ -521,6 +936,10 @@ I analyze posts shared from channels using ChatGPT to provide:
                 logger.info("Bot not actually mentioned in channel message")
                 return
 
+            # Follow-up question about an analyzed post or one of the bot's answers
+            if await self.handle_follow_up_mention(update, message, bot_username):
+                return
+
             # Ignore if replying to the bot's own message
             if message.reply_to_message and self.bot_id and getattr(message.reply_to_message.from_user, 'id',
                                                                     None) == self.bot_id:
@@ -573,43 +992,197 @@ I analyze posts shared from channels using ChatGPT to provide:
             else:
                 # No reply or quote: answer as a general assistant
                 logger.info("No reply or quote detected, answering as a general assistant")
-                answer = await self.analyzer.answer_general_question(message.text)
-                await message.reply_text(answer, parse_mode=ParseMode.MARKDOWN_V2)
+                await self.run_admitted([update], message, self.process_general_question, message)
                 return
-            await self.process_single_message(target_message, context, original_message=message,
-                                              custom_prompt=custom_prompt)
+            await self.run_admitted([update], message, self.process_single_message, target_message, context,
+                                    original_message=message, custom_prompt=custom_prompt)
         except Exception as e:
             logger.error(f"Error handling channel mention: {e}")
             await update.message.reply_text("❌ Вибачте, сталася помилка при аналізі згаданого поста. Спробуйте ще раз.")
 
+    async def watch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /watch in a channel: analyze its posts in batches and send digests"""
+        post = update.channel_post
+        self.channel_watcher.watch(post.chat_id)
+        logger.info(f"Watching channel {post.chat_id}")
+        await post.reply_text(
+            f"👁 Канал під наглядом. Дайджест буде кожні {self.channel_watcher.window / 60:.0f} хв "
+            f"або кожні {self.channel_watcher.max_posts} постів. /unwatch — вимкнути."
+        )
+
+    async def unwatch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unwatch in a channel: stop the digests"""
+        post = update.channel_post
+        self.channel_watcher.unwatch(post.chat_id)
+        logger.info(f"Stopped watching channel {post.chat_id}")
+        await post.reply_text("👁 Нагляд за каналом вимкнено.")
+
+    async def handle_channel_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Buffer posts of watched channels for the next digest"""
+        post = update.channel_post
+        if not post or not self.channel_watcher.is_watched(post.chat_id):
+            return
+        if self.draining:
+            self.hand_off([update])
+            return
+        self.channel_watcher.add(update)
+
+    def start_channel_batch(self, chat_id: int, posts: list, updates: list) -> asyncio.Task:
+        """Start processing a flushed window of channel posts"""
+        # Registered right away, so that drain() hands the window off even if its task has not run yet
+        job = {'updates': updates, 'task': None, 'started': False}
+        self.jobs.append(job)
+        job['task'] = asyncio.create_task(self.process_channel_batch(chat_id, posts, job))
+        job['task'].add_done_callback(lambda _: self.jobs.remove(job))
+        return job['task']
+
+    async def process_channel_batch(self, chat_id: int, posts: list, job: dict):
+        """Analyze a window of channel posts and send the digest"""
+        # Digests share the analysis slots with user requests, so a busy channel cannot flood the API
+        ticket = self.admission.submit(chat_id, chat_id, background=True)
+        try:
+            await self.admission.wait(ticket)
+            job['started'] = True
+
+            channel = posts[0].chat
+            channel_info = f"@{channel.username}" if channel.username else channel.title
+
+            batch = []
+            for post in posts:
+                text = (post.text or post.caption or "")[:CHANNEL_POST_MAX_LENGTH]
+                if post.photo or post.video or post.document:
+                    text = "[media] " + text
+                batch.append({'id': post.message_id, 'text': text or "[no text]"})
+
+            logger.info(f"Analyzing {len(batch)} posts of channel {channel_info} in one batch")
+            result = await self.analyze_channel_posts(batch, channel_info)
+            if not result:
+                logger.error(f"No digest for channel {channel_info}, batch analysis failed for all posts")
+                return
+
+            digest = self.format_channel_digest(channel, channel_info, result)
+            logger.info("Digest: " + digest)
+            await self.application.bot.send_message(chat_id=CHANNEL_WATCH_DIGEST_CHAT_ID or chat_id, text=digest)
+        except Exception as e:
+            logger.error(f"Error processing channel batch: {e}")
+        finally:
+            self.admission.release(ticket)
+
+    async def analyze_channel_posts(self, batch: list, channel_info: str):
+        """
+        Analyze channel posts in one request, splitting the batch in halves
+        when the request fails, so that one bad window does not lose all posts
+
+        Returns:
+            dict: Merged {"posts", "digest"}, or None if no post could be analyzed
+        """
+        result = await self.analyzer.analyze_channel_batch(batch, channel_info)
+        if result or len(batch) == 1:
+            if not result:
+                logger.error(f"Post {batch[0]['id']} of channel {channel_info} could not be analyzed")
+            return result
+
+        logger.warning(f"Batch of {len(batch)} posts of channel {channel_info} failed, retrying in halves")
+        half = len(batch) // 2
+        parts = [await self.analyze_channel_posts(part, channel_info) for part in (batch[:half], batch[half:])]
+        parts = [part for part in parts if part]
+        if not parts:
+            return None
+        return {
+            'posts': [post for part in parts for post in part['posts']],
+            'digest': " ".join(part.get('digest', '').strip() for part in parts).strip()
+        }
+
+    def format_channel_digest(self, channel, channel_info: str, result: dict) -> str:
+        """Format a batch analysis as a digest with a score line per post"""
+        lines = [f"📰 Дайджест каналу {channel_info} — постів: {len(result['posts'])}", ""]
+        if result.get("digest"):
+            lines += [result["digest"].strip(), ""]
+        lines.append("📊 Пропаганда / Неправда / Популізм / Маніпуляції / Токсичність / Паніка / Трешпостинг:")
+        for item in result["posts"]:
+            post_ref = f"https://t.me/{channel.username}/{item.get('id')}" if channel.username else f"#{item.get('id')}"
+            scores = " / ".join(f"{item.get(key, '?')}%" for key in CHANNEL_SCORE_KEYS)
+            lines.append(f"• {post_ref} — {item.get('summary', '')}")
+            lines.append(f"  {scores}")
+
+        digest = "\n".join(lines)
+        if len(digest) > TELEGRAM_MESSAGE_MAX_LENGTH:
+            digest = digest[:TELEGRAM_MESSAGE_MAX_LENGTH - 1] + "…"
+        return digest
+
     async def run(self):
         """Run the bot"""
         logger.info("=== STARTING TELEGRAM BOT ===")
         logger.info("Bot is initializing...")
+        if self.fast_start:
+            # Overlap the slow SDK import with the network round-trips below
+            self.warm_up_task = asyncio.create_task(self.warm_up())
+        self.build_application()
+        startup_profiler.mark("application built")
         await self.application.initialize()
-        # Get bot id
-        me = await self.application.bot.get_me()
-        self.bot_id = me.id
+        # initialize() already called getMe, so the bot id is known without another request
+        self.bot_id = self.application.bot.id
+        startup_profiler.mark("application initialized")
         await self.application.start()
+        await self.load_handoff()
+        self.handoff_task = asyncio.create_task(self.watch_handoff())
         await self.application.updater.start_polling()
+        startup_profiler.mark("polling started")
+        if not self.fast_start:
+            # Load the OpenAI SDK in a worker thread now, so the first analysis neither waits for it
+            # on the event loop nor delays polling
+            self.warm_up_task = asyncio.create_task(self.warm_up())
+        if startup_profiler.enabled:
+            startup_profiler.report()
+
+        # Stop gracefully on SIGTERM (supervisor) and SIGINT (Ctrl+C)
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                # Not supported on Windows; Ctrl+C still raises KeyboardInterrupt there
+                pass
 
         logger.info("=== BOT IS RUNNING ===")
         logger.info("Press Ctrl+C to stop.")
         logger.info("Waiting for messages...")
 
-        try:
-            # Keep the bot running
-            await asyncio.Event().wait()
-        except KeyboardInterrupt:
-            logger.info("Stopping bot...")
-            await self.application.updater.stop()
-            await self.application.stop()
-            await self.application.shutdown()
+        # Keep the bot running
+        await stop_event.wait()
+
+        logger.info("Stopping bot...")
+        # From now on this instance hands updates off instead of taking them over
+        self.handoff_task.cancel()
+        # Stop fetching updates first; already fetched ones are marked as read and handled or handed off
+        await self.application.updater.stop()
+        await self.drain()
+        # stop() still processes queued updates and waits for running handlers, which may hand off more updates
+        await self.application.stop()
+        self.save_handoff()
+        await self.application.shutdown()
+        await self.link_enricher.close()
+        logger.info("Bot stopped")
 
 
 def main():
     """Main function to run the bot"""
-    bot = TelegramBot()
+    parser = argparse.ArgumentParser(description="Telegram Post Analyzer Bot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="log how long each startup phase takes and compare it with STARTUP_BUDGET")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="start loading the OpenAI client in the background before connecting to Telegram "
+                             "(best effort, the startup budget is checked but not enforced)")
+    args = parser.parse_args()
+
+    validate_config()
+    startup_profiler.enabled = args.profile_startup
+    if args.profile_startup or args.fast_start:
+        startup_profiler.budget = STARTUP_BUDGET
+    startup_profiler.mark("imports and config")
+
+    bot = TelegramBot(fast_start=args.fast_start)
     asyncio.run(bot.run())
 
 
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, RequestSuperseded
+
+
+def controller(**kwargs):
+    limits = {"max_concurrent": 1, "max_queue": 10, "max_per_user": 10, "max_per_chat": 10,
+              "drop_superseded": True}
+    limits.update(kwargs)
+    return AdmissionController(**limits)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_rejects_user_over_quota():
+    async def main():
+        admission = controller(max_per_user=2)
+        admission.submit(1, 100)
+        admission.submit(1, 200)
+        with pytest.raises(AdmissionRejected):
+            admission.submit(1, 300)
+        # Other users are not affected
+        admission.submit(2, 100)
+
+    run(main())
+
+
+def test_rejects_chat_over_quota():
+    async def main():
+        admission = controller(max_per_chat=2)
+        admission.submit(1, 100)
+        admission.submit(2, 100)
+        with pytest.raises(AdmissionRejected):
+            admission.submit(3, 100)
+        admission.submit(3, 200)
+
+    run(main())
+
+
+def test_rejects_when_queue_is_full():
+    async def main():
+        admission = controller(max_queue=1)
+        running = admission.submit(1, 100)
+        queued = admission.submit(2, 100)
+        with pytest.raises(AdmissionRejected):
+            admission.submit(3, 100)
+        return running, queued, admission
+
+    running, queued, admission = run(main())
+    assert admission.running == {running}
+    assert list(admission.queue) == [queued]
+
+
+def test_same_key_supersedes_queued_request_in_place():
+    async def main():
+        admission = controller()
+        admission.submit(9, 100)
+        old = admission.submit(1, 100, key="post")
+        other = admission.submit(2, 100, key="post")
+        new = admission.submit(1, 100, key="post")
+
+        with pytest.raises(RequestSuperseded):
+            await admission.wait(old)
+        assert list(admission.queue) == [new, other]
+        assert admission.position(new) == 1
+
+    run(main())
+
+
+@pytest.mark.parametrize("user_id, chat_id, key", [
+    (1, 100, "other post"),  # Different content
+    (1, 200, "post"),  # Same content in another chat
+    (1, 100, None),  # No content identity
+])
+def test_different_request_is_not_superseded(user_id, chat_id, key):
+    async def main():
+        admission = controller()
+        admission.submit(9, 100)
+        old = admission.submit(1, 100, key="post")
+        new = admission.submit(user_id, chat_id, key=key)
+        assert not old.admitted.done()
+        assert list(admission.queue) == [old, new]
+
+    run(main())
+
+
+def test_running_request_is_not_superseded():
+    async def main():
+        admission = controller()
+        running = admission.submit(1, 100, key="post")
+        queued = admission.submit(1, 100, key="post")
+        await admission.wait(running)
+        assert admission.position(queued) == 1
+
+    run(main())
+
+
+def test_release_admits_next_queued_request():
+    async def main():
+        admission = controller()
+        first = admission.submit(1, 100)
+        second = admission.submit(2, 100)
+        third = admission.submit(3, 100)
+        assert (admission.position(first), admission.position(second), admission.position(third)) == (0, 1, 2)
+
+        admission.release(first)
+        await asyncio.wait_for(admission.wait(second), 1)
+        assert admission.position(third) == 1
+        # Releasing twice must not free a second slot
+        admission.release(first)
+        assert not third.admitted.done()
+
+    run(main())
+
+
+def test_cancelled_waiter_releases_its_queue_place():
+    async def main():
+        admission = controller()
+        running = admission.submit(1, 100)
+        cancelled = admission.submit(2, 100)
+        last = admission.submit(3, 100)
+
+        waiter = asyncio.ensure_future(admission.wait(cancelled))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        admission.release(cancelled)
+        assert admission.position(last) == 1
+
+        # The slot freed by the running request goes to the next request that still waits
+        admission.release(running)
+        await asyncio.wait_for(admission.wait(last), 1)
+        assert admission.running == {last}
+
+    run(main())
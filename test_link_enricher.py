@@ -0,0 +1,228 @@
+import asyncio
+
+import httpx
+import pytest
+
+import link_enricher
+from link_enricher import LinkEnricher
+
+ARTICLE = """
+<html><head>
+<title>Plain title</title>
+<meta property="og:title" content="OG title">
+</head><body>
+<p>Short byline</p>
+<p>This is the lead paragraph of the article, long enough to be used as the lead.</p>
+</body></html>
+"""
+
+
+@pytest.fixture(autouse=True)
+def public_dns(monkeypatch):
+    """Resolve test hosts to a public address; IP literals resolve to themselves"""
+    async def resolve_host(host):
+        return [host] if host[0].isdigit() or ":" in host else ["93.184.216.34"]
+    monkeypatch.setattr(link_enricher, "resolve_host", resolve_host)
+
+
+class Server:
+    """Local stand-in for the linked sites, counting the requests per path"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.hits = {}
+        self.requests = []
+
+    async def handle(self, request):
+        self.hits[request.url.path] = self.hits.get(request.url.path, 0) + 1
+        self.requests.append(request)
+        return await self.routes[request.url.path](request)
+
+    def enricher(self, **kwargs):
+        return LinkEnricher(transport=httpx.MockTransport(self.handle), **kwargs)
+
+
+def html(body, status=200, headers=None):
+    async def route(request):
+        return httpx.Response(status, text=body, headers={"content-type": "text/html; charset=utf-8", **(headers or {})})
+    return route
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_extracts_og_title_and_lead():
+    server = Server({"/a": html(ARTICLE)})
+
+    async def main():
+        enricher = server.enricher()
+        info = await enricher.fetch("http://example.com/a")
+        await enricher.close()
+        return info
+
+    assert run(main()) == {
+        "title": "OG title",
+        "lead": "This is the lead paragraph of the article, long enough to be used as the lead."
+    }
+
+
+def test_falls_back_to_title_tag_and_meta_description():
+    page = '<html><head><title> Plain  title </title><meta name="description" content="Meta lead"></head></html>'
+    server = Server({"/a": html(page)})
+
+    async def main():
+        enricher = server.enricher()
+        info = await enricher.fetch("http://example.com/a")
+        await enricher.close()
+        return info
+
+    assert run(main()) == {"title": "Plain title", "lead": "Meta lead"}
+
+
+def test_reads_only_max_bytes():
+    page = "<html><head><title>Big page</title></head><body>" + "x" * 5000 + \
+           "<p>This lead paragraph is beyond the size cap and must not be read at all.</p></body></html>"
+    server = Server({"/big": html(page)})
+
+    async def main():
+        enricher = server.enricher(max_bytes=1024)
+        info = await enricher.fetch("http://example.com/big")
+        await enricher.close()
+        return info
+
+    assert run(main()) == {"title": "Big page", "lead": ""}
+
+
+def test_slow_page_times_out():
+    async def slow(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, text=ARTICLE, headers={"content-type": "text/html"})
+    server = Server({"/slow": slow})
+
+    async def main():
+        enricher = server.enricher(timeout=0.1)
+        summary = await enricher.summarize_urls(["http://example.com/slow"])
+        await enricher.close()
+        return summary
+
+    assert run(main()) == "- http://example.com/slow — (could not be fetched)"
+
+
+def test_cache_expires_after_ttl():
+    server = Server({"/a": html(ARTICLE)})
+
+    async def main():
+        enricher = server.enricher(cache_ttl=0.2)
+        await enricher.fetch("http://example.com/a")
+        await enricher.fetch("http://example.com/a")
+        hits_before_expiry = server.hits["/a"]
+        await asyncio.sleep(0.3)
+        await enricher.fetch("http://example.com/a")
+        await enricher.close()
+        return hits_before_expiry
+
+    assert run(main()) == 1
+    assert server.hits["/a"] == 2
+
+
+def test_concurrent_fetches_of_same_url_share_one_request():
+    async def slow_article(request):
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, text=ARTICLE, headers={"content-type": "text/html"})
+    server = Server({"/a": slow_article})
+
+    async def main():
+        enricher = server.enricher()
+        summaries = await asyncio.gather(*(enricher.summarize_urls(["http://example.com/a"]) for _ in range(5)))
+        await enricher.close()
+        return summaries
+
+    summaries = run(main())
+    assert server.hits["/a"] == 1
+    assert len(set(summaries)) == 1
+    assert "OG title" in summaries[0]
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/admin",
+    "http://10.0.0.5/",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/",
+    "file:///etc/passwd",
+])
+def test_refuses_non_public_urls(url):
+    server = Server({})
+
+    async def main():
+        enricher = server.enricher()
+        info = await enricher.fetch(url)
+        await enricher.close()
+        return info
+
+    assert run(main()) is None
+    assert server.hits == {}
+
+
+def test_checks_every_redirect_hop():
+    server = Server({
+        "/public": html(ARTICLE),
+        "/to-public": html("", status=302, headers={"location": "/public"}),
+        "/to-private": html("", status=302, headers={"location": "http://169.254.169.254/latest/meta-data/"}),
+    })
+
+    async def main():
+        enricher = server.enricher()
+        followed = await enricher.fetch("http://example.com/to-public")
+        refused = await enricher.fetch("http://example.com/to-private")
+        await enricher.close()
+        return followed, refused
+
+    followed, refused = run(main())
+    assert followed["title"] == "OG title"
+    assert refused is None
+    assert "/latest/meta-data/" not in server.hits
+
+
+def test_connects_to_the_checked_address(monkeypatch):
+    """A host that resolves to a public address for the check and to a private one later (DNS rebinding)"""
+    answers = [["93.184.216.34"], ["127.0.0.1"]]
+
+    async def rebinding_resolve_host(host):
+        return answers.pop(0) if answers else ["127.0.0.1"]
+    monkeypatch.setattr(link_enricher, "resolve_host", rebinding_resolve_host)
+    server = Server({"/a": html(ARTICLE)})
+
+    async def main():
+        enricher = server.enricher()
+        info = await enricher.fetch("https://rebind.example:8443/a")
+        await enricher.close()
+        return info
+
+    assert run(main())["title"] == "OG title"
+    request, = server.requests
+    assert request.url.host == "93.184.216.34"
+    assert request.url.port == 8443
+    assert request.headers["host"] == "rebind.example:8443"
+    assert request.extensions["sni_hostname"] == "rebind.example"
+
+
+def test_rebinding_on_a_redirect_hop_is_refused(monkeypatch):
+    answers = [["93.184.216.34"], ["169.254.169.254"]]
+
+    async def rebinding_resolve_host(host):
+        return answers.pop(0)
+    monkeypatch.setattr(link_enricher, "resolve_host", rebinding_resolve_host)
+    server = Server({
+        "/to-self": html("", status=302, headers={"location": "/latest/meta-data/"}),
+        "/latest/meta-data/": html(ARTICLE),
+    })
+
+    async def main():
+        enricher = server.enricher()
+        info = await enricher.fetch("http://rebind.example/to-self")
+        await enricher.close()
+        return info
+
+    assert run(main()) is None
+    assert "/latest/meta-data/" not in server.hits
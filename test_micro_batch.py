@@ -0,0 +1,133 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import chatgpt_analyzer
+from chatgpt_analyzer import ChatGPTAnalyzer
+
+
+class FakeClient:
+    """Stand-in for the OpenAI client: batch requests get batch_reply, single requests echo the post"""
+
+    def __init__(self, batch_reply=None, finish_reason="stop"):
+        self.batch_reply = batch_reply  # callable (post ids) -> response content
+        self.finish_reason = finish_reason
+        self.batch_calls = []  # Post ids of every batch request
+        self.single_calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if "response_format" in kwargs:
+            ids = re.findall(r"=== POST (\d+) ===", prompt)
+            self.batch_calls.append(ids)
+            return self.response(self.batch_reply(ids), self.finish_reason)
+        self.single_calls += 1
+        post_text = re.search(r"POST: (.*)", prompt).group(1)
+        return self.response(f"single {post_text}", "stop")
+
+    @staticmethod
+    def response(content, finish_reason):
+        return SimpleNamespace(choices=[SimpleNamespace(
+            finish_reason=finish_reason, message=SimpleNamespace(content=content))])
+
+
+def answer_all(ids):
+    return json.dumps({"items": [{"id": int(post_id), "analysis": f"batched {post_id}"} for post_id in ids]})
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    """Batches of up to 3 posts, collected for 50 ms"""
+    monkeypatch.setattr(chatgpt_analyzer, "MICRO_BATCH_SIZE", 3)
+    monkeypatch.setattr(chatgpt_analyzer, "MICRO_BATCH_WAIT_MS", 50)
+
+
+def analyzer_with(client):
+    analyzer = ChatGPTAnalyzer()
+
+    async def get_client():
+        return client
+    analyzer.get_client = get_client
+    return analyzer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def analyze(analyzer, count):
+    return asyncio.gather(*(analyzer.analyze_post_batched(f"post {index}", "channel") for index in range(1, count + 1)))
+
+
+def test_full_batch_is_sent_without_waiting(batching, monkeypatch):
+    monkeypatch.setattr(chatgpt_analyzer, "MICRO_BATCH_WAIT_MS", 10000)
+    client = FakeClient(answer_all)
+
+    async def main():
+        analyzer = analyzer_with(client)
+        return await asyncio.wait_for(analyze(analyzer, 3), 1)
+
+    assert run(main()) == ["batched 1", "batched 2", "batched 3"]
+    assert client.batch_calls == [["1", "2", "3"]]
+
+
+def test_partial_batch_is_sent_after_the_wait(batching):
+    client = FakeClient(answer_all)
+
+    async def main():
+        analyzer = analyzer_with(client)
+        started = asyncio.get_running_loop().time()
+        results = await analyze(analyzer, 2)
+        return results, asyncio.get_running_loop().time() - started
+
+    results, elapsed = run(main())
+    assert results == ["batched 1", "batched 2"]
+    assert client.batch_calls == [["1", "2"]]
+    assert elapsed >= 0.05
+
+
+def test_posts_beyond_the_batch_size_start_a_new_batch(batching):
+    client = FakeClient(answer_all)
+
+    async def main():
+        analyzer = analyzer_with(client)
+        return await analyze(analyzer, 4)
+
+    assert run(main()) == ["batched 1", "batched 2", "batched 3", "single post 4"]
+    # The fourth post waits for the timer and is then analyzed alone
+    assert client.batch_calls == [["1", "2", "3"]]
+    assert client.single_calls == 1
+
+
+def test_posts_missing_from_the_answer_fall_back_to_single_requests(batching):
+    def answer_first(ids):
+        return json.dumps({"items": [{"id": 1, "analysis": "batched 1"}, {"id": 2, "analysis": "  "}]})
+    client = FakeClient(answer_first)
+
+    async def main():
+        analyzer = analyzer_with(client)
+        return await analyze(analyzer, 3)
+
+    assert run(main()) == ["batched 1", "single post 2", "single post 3"]
+    assert client.single_calls == 2
+
+
+@pytest.mark.parametrize("reply, finish_reason", [
+    ("not json", "stop"),
+    ('{"items": "oops"}', "stop"),
+    ('{"items": [{"id": 1, "analysis": "cut', "length"),
+])
+def test_broken_answer_falls_back_to_single_requests(batching, reply, finish_reason):
+    client = FakeClient(lambda ids: reply, finish_reason)
+
+    async def main():
+        analyzer = analyzer_with(client)
+        return await analyze(analyzer, 2)
+
+    assert run(main()) == ["single post 1", "single post 2"]
+    assert len(client.batch_calls) == 1
+    assert client.single_calls == 2